@@ -0,0 +1,6 @@
+import os
+
+if os.getenv("STARTUP_PROFILE"):
+    # installed first so every later import in the app is timed
+    from .startup import install_import_profiler
+    install_import_profiler()
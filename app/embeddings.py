@@ -10,7 +10,9 @@ This allows the app to run ingestion/audit endpoints in lightweight containers.
 """
 
 import os
+import threading
 from typing import List, Dict
+from .startup import timed
 _HAS_NUMPY = False
 _HAS_SENT_TRANS = False
 _HAS_FAISS = False
@@ -65,10 +67,18 @@ class EmbeddingProvider:
         self.model_name = model_name or os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
         self._impl = None
         self._initialized = False
+        self._init_lock = threading.Lock()
 
     def _init_impl(self):
         if self._initialized:
             return
+        with self._init_lock:
+            if self._initialized:
+                return
+            with timed("init:embeddings"):
+                self._load_impl()
+
+    def _load_impl(self):
         _try_imports()
         if _HAS_NUMPY and _HAS_SENT_TRANS and _HAS_FAISS:
             import numpy as np 
@@ -118,3 +128,19 @@ class EmbeddingProvider:
     def search(self, vectors, k=5):
         self._init_impl()
         return self._impl.search(vectors, k)
+
+
+_shared_provider = None
+_shared_lock = threading.Lock()
+
+def get_embedding_provider() -> EmbeddingProvider:
+    """
+    Process-wide provider, so the model is loaded once instead of per request
+    (and once in the master when preloading for forked workers).
+    """
+    global _shared_provider
+    if _shared_provider is None:
+        with _shared_lock:
+            if _shared_provider is None:
+                _shared_provider = EmbeddingProvider()
+    return _shared_provider
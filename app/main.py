@@ -4,26 +4,48 @@ import tempfile
 import uuid
 import time
 from typing import List, Optional
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from .pdf_extract import extract_pdf_pages_with_spans, join_pages_to_full_text
+from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field
+from .pdf_extract import extract_pdf_pages_with_spans, join_pages_to_full_text, LAYOUT_MODES, PdfExtractionError
 from .db import init_db, SessionLocal
 from .models import Document
 from .retriever import Retriever
+from .positional_index import index_document
 from .audit import run_audit
 from .webhook import emit_event
 from .extract import extract_fields
+from .scheduler import scheduler, Overloaded, SlotReleasingIterator
+from .startup import lazy_import, timed, startup_report, preload
 
-# Optional
+# Optional; the openai package is imported on the first /ask that needs it
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 USE_OPENAI = bool(OPENAI_API_KEY)
-if USE_OPENAI:
-    try:
-        import openai
-        openai.api_key = OPENAI_API_KEY
-    except Exception:
-        USE_OPENAI = False
+_openai = None
+
+def _load_openai():
+    """Resolve and configure the openai module once; None if it can't be imported."""
+    global USE_OPENAI, _openai
+    if _openai is None and USE_OPENAI:
+        try:
+            _openai = lazy_import("openai")
+        except Exception:
+            USE_OPENAI = False
+            return None
+        _openai.api_key = OPENAI_API_KEY
+    return _openai
+
+# "blocks" or "words" also stores bounding boxes per page for citation highlighting
+PDF_LAYOUT_MODE = os.getenv("PDF_LAYOUT_MODE") or None
+if PDF_LAYOUT_MODE is not None and PDF_LAYOUT_MODE not in LAYOUT_MODES:
+    raise ValueError(f"PDF_LAYOUT_MODE must be one of {LAYOUT_MODES}, got {PDF_LAYOUT_MODE!r}")
+
+# PRELOAD_MODELS=1 with `gunicorn --preload`: load once in the master, share with workers
+if os.getenv("PRELOAD_MODELS"):
+    with timed("init:preload"):
+        preload()
 
 app = FastAPI(title="Contract Intelligence - Prototype")
 
@@ -34,9 +56,20 @@ METRICS = {
     "extract_count": 0
 }
 
+@app.exception_handler(Overloaded)
+def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "server busy, retry later", "lane": exc.lane, "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 @app.on_event("startup")
 def startup():
-    init_db()
+    with timed("init:init_db"):
+        init_db()
+    if os.getenv("STARTUP_PROFILE"):
+        print("STARTUP PROFILE:", startup_report())
 
 @app.get("/healthz")
 def healthz():
@@ -45,54 +78,80 @@ def healthz():
 @app.get("/metrics")
 def get_metrics():
     # return a copy
-    return dict(METRICS)
+    out = dict(METRICS)
+    out["scheduler"] = scheduler.snapshot()
+    out["startup"] = startup_report()
+    return out
+
+# Scheduled endpoints are async: admission is awaited on the event loop (a queued
+# request holds no thread) and only admitted work is run in the threadpool.
 
 @app.post("/ingest")
 async def ingest(files: list[UploadFile] = File(...)):
     """
     Ingest PDF(s): extract pages & full_text, store to DB, return document_id.
+    Runs in the bulk "ingest" lane of the scheduler.
     """
     if not files:
         raise HTTPException(status_code=400, detail="no files provided")
-    db = SessionLocal()
-    results = []
+    async with scheduler.slot("ingest"):
+        return await run_in_threadpool(_ingest_files, files)
+
+def _ingest_files(files: list[UploadFile]):
+    # all-or-nothing: every file is extracted before any document is stored,
+    # so a 400/422 never leaves earlier files of the request half-ingested
     for uploaded in files:
         if not uploaded.filename.lower().endswith(".pdf"):
             raise HTTPException(status_code=400, detail="only pdf allowed")
-        tmp_file = None
-        try:
-            tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-            with tmp_file as f:
-                shutil.copyfileobj(uploaded.file, f)
-            tmp_path = tmp_file.name
-            pages = extract_pdf_pages_with_spans(tmp_path)
+    extracted = [(uploaded.filename, _extract_upload(uploaded)) for uploaded in files]
+
+    db = SessionLocal()
+    try:
+        results = []
+        for filename, pages in extracted:
             full_text = join_pages_to_full_text(pages)
             doc = Document(
-                filename=uploaded.filename,
+                filename=filename,
                 full_text=full_text,
                 pages=pages,
                 metadata_json={}
             )
             db.add(doc)
-            db.commit()
-            db.refresh(doc)
-            results.append({"document_id": doc.id, "filename": uploaded.filename, "pages": len(pages), "chars": len(full_text)})
-            METRICS["ingest_count"] += 1
-        finally:
-            if tmp_file is not None:
-                try:
-                    os.remove(tmp_file.name)
-                except OSError:
-                    pass
-    db.close()
+            db.flush()  # assigns doc.id; documents and postings commit together
+            index_document(db, doc.id, full_text)
+            results.append({"document_id": doc.id, "filename": filename, "pages": len(pages), "chars": len(full_text)})
+        db.commit()
+    finally:
+        db.close()
+    METRICS["ingest_count"] += len(results)
     return {"ingested": results}
 
+def _extract_upload(uploaded: UploadFile):
+    tmp_file = None
+    try:
+        tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+        with tmp_file as f:
+            shutil.copyfileobj(uploaded.file, f)
+        try:
+            return extract_pdf_pages_with_spans(tmp_file.name, layout=PDF_LAYOUT_MODE)
+        except PdfExtractionError:
+            raise HTTPException(status_code=422, detail=f"could not extract text from {uploaded.filename}")
+    finally:
+        if tmp_file is not None:
+            try:
+                os.remove(tmp_file.name)
+            except OSError:
+                pass
+
+MAX_PASSAGES_PER_DOC = 5
+
 class AskRequest(BaseModel):
     question: str
     top_k: int = 3
+    passages_per_doc: int = Field(2, ge=1, le=MAX_PASSAGES_PER_DOC)
     document_ids: Optional[List[int]] = None
 
-def _call_openai(prompt: str, max_tokens: int = 256) -> str:
+def _call_openai(openai, prompt: str, max_tokens: int = 256) -> str:
     try:
         resp = openai.ChatCompletion.create(
             model="gpt-4o-mini" if hasattr(openai, "ChatCompletion") else "gpt-3.5-turbo",
@@ -105,30 +164,37 @@ def _call_openai(prompt: str, max_tokens: int = 256) -> str:
         return f"(openai-error) {str(e)}"
 
 @app.post("/ask")
-def ask(req: AskRequest):
+async def ask(req: AskRequest):
     """
     RAG-style QA endpoint.
     - Uses Retriever to get top-k snippets (structured results with doc_id/page/start/end/text)
     - Builds prompt using snippets and either calls real LLM (if available) or returns a mock answer.
     - Always returns citations in the shape: {document_id, page, start, end}
+    Runs in the interactive "ask" lane of the scheduler.
     """
+    async with scheduler.slot("ask"):
+        return await run_in_threadpool(_answer, req)
+
+def _answer(req: AskRequest):
     METRICS["ask_count"] += 1
     retriever = Retriever()
-    res = retriever.query(req.question, k=req.top_k)
+    res = retriever.query(req.question, k=req.top_k, passages_per_doc=req.passages_per_doc)
     results = res.get("results", [])
 
     snippets_text = []
     citations = []
-    for i, r in enumerate(results):
-        citations.append({
-            "document_id": r["document_id"],
-            "page": r.get("page"),
-            "start": r["start"],
-            "end": r["end"]
-        })
-        snippets_text.append(f"[{i+1}] (doc:{r['document_id']} page:{r.get('page')}) {r['text']}")
-
-    if USE_OPENAI and snippets_text:
+    for r in results:
+        for p in r.get("passages") or [r]:
+            citations.append({
+                "document_id": r["document_id"],
+                "page": p.get("page"),
+                "start": p["start"],
+                "end": p["end"]
+            })
+            snippets_text.append(f"[{len(snippets_text)+1}] (doc:{r['document_id']} page:{p.get('page')}) {p['text']}")
+
+    openai = _load_openai() if snippets_text else None
+    if openai is not None:
         prompt = (
             "You are a contract assistant. Answer the question using ONLY the evidence below. "
             "If the evidence does not contain the answer, say 'I don't know'.\n\n"
@@ -136,52 +202,69 @@ def ask(req: AskRequest):
             "Evidence:\n" + "\n\n".join(snippets_text) + "\n\n"
             "Answer concisely and include citations like (doc:page:start-end) where appropriate."
         )
-        answer_text = _call_openai(prompt)
+        answer_text = _call_openai(openai, prompt)
     else:
         answer_text = f"(mock) Answer generated using {len(snippets_text)} snippet(s). Question: {req.question}"
 
     return {"answer": answer_text, "citations": citations}
 
 @app.get("/ask/stream")
-def ask_stream(q: str):
+async def ask_stream(q: str):
+    # acquire before streaming starts so a shed request still gets a proper 429.
+    # The slot is released by the background task once the response is done
+    # (also after a disconnect), or by the body iterator's close/finalizer if the
+    # response is never sent at all.
+    slot = await scheduler.acquire("ask_stream")
     def event_stream():
         parts = ["Starting retrieval...", "Retrieving context...", "Formulating answer...", "Finalizing..."]
         for p in parts:
             yield f"data: {p}\n\n"
             time.sleep(0.2)
         yield f"data: (mock) Answer: This is the streamed answer for: {q}\n\n"
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+    return StreamingResponse(
+        SlotReleasingIterator(event_stream(), slot),
+        media_type="text/event-stream",
+        background=BackgroundTask(slot.release),
+    )
 
 class AuditRequest(BaseModel):
     document_id: int
 
 @app.post("/audit")
-def audit(req: AuditRequest, background_tasks: BackgroundTasks, webhook_url: Optional[str] = None):
-    METRICS["audit_count"] += 1
-    db = SessionLocal()
-    doc = db.query(Document).filter(Document.id == req.document_id).first()
-    db.close()
-    if not doc:
-        raise HTTPException(status_code=404, detail="document not found")
-    findings = run_audit(doc.full_text)
+async def audit(req: AuditRequest, background_tasks: BackgroundTasks, webhook_url: Optional[str] = None):
+    async with scheduler.slot("audit"):
+        METRICS["audit_count"] += 1
+        findings = await run_in_threadpool(_audit_document, req.document_id)
     if webhook_url:
         payload = {"document_id": req.document_id, "findings_count": len(findings), "sample_findings": findings[:3]}
         background_tasks.add_task(emit_event, webhook_url, payload)
     return {"findings": findings}
 
+def _audit_document(document_id: int):
+    db = SessionLocal()
+    doc = db.query(Document).filter(Document.id == document_id).first()
+    db.close()
+    if not doc:
+        raise HTTPException(status_code=404, detail="document not found")
+    return run_audit(doc.full_text)
+
 @app.post("/extract")
-def extract_document(document_id: int):
+async def extract_document(document_id: int):
     """
     Return structured extraction for given document id.
     """
-    METRICS["extract_count"] += 1
+    async with scheduler.slot("extract"):
+        METRICS["extract_count"] += 1
+        fields = await run_in_threadpool(_extract_document, document_id)
+    return {"document_id": document_id, "extraction": fields}
+
+def _extract_document(document_id: int):
     db = SessionLocal()
     doc = db.query(Document).filter(Document.id == document_id).first()
     db.close()
     if not doc:
         raise HTTPException(status_code=404, detail="document not found")
-    fields = extract_fields(doc.full_text)
-    return {"document_id": document_id, "extraction": fields}
+    return extract_fields(doc.full_text)
 
 @app.post("/webhook/events")
 def webhook_receiver(payload: dict):
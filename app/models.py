@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON, Text
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Text, ForeignKey, UniqueConstraint
 from .db import Base
 import datetime
 
@@ -10,3 +10,12 @@ class Document(Base):
     metadata_json = Column("metadata", JSON, default={})
     full_text = Column(Text, default="")
     pages = Column(JSON, default=[])
+
+class TermPosting(Base):
+    """Positional index: character offsets of one term in one document's full_text."""
+    __tablename__ = "term_postings"
+    __table_args__ = (UniqueConstraint("document_id", "term"),)
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False, index=True)
+    term = Column(String, nullable=False, index=True)
+    positions = Column(JSON, default=[])
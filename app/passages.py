@@ -0,0 +1,109 @@
+"""
+Passage scoring over term-position lists.
+
+Given the sorted character positions of query-term matches in a document
+(from the positional index), find the densest fixed-size windows with a
+two-pointer sweep that is linear in the number of matches, and return the
+top-k non-overlapping passages. No pass over the full text is needed.
+"""
+
+import heapq
+import re
+from typing import Dict, Iterable, List, Tuple
+
+TERM_RE = re.compile(r"\w+")
+MIN_TERM_LEN = 3
+WINDOW_CHARS = 280
+
+# (start, end, query_term_index), sorted by start
+Match = Tuple[int, int, int]
+
+def query_terms(text: str) -> List[str]:
+    """Lowercased, de-duplicated query terms (same filter the retriever always used)."""
+    seen = []
+    for t in TERM_RE.findall(text.lower()):
+        if len(t) >= MIN_TERM_LEN and t not in seen:
+            seen.append(t)
+    return seen
+
+def term_positions(text: str) -> Dict[str, List[int]]:
+    """Build the positional index of one document: term -> sorted start offsets."""
+    index: Dict[str, List[int]] = {}
+    for m in TERM_RE.finditer(text.lower()):
+        term = m.group(0)
+        if len(term) >= MIN_TERM_LEN:
+            index.setdefault(term, []).append(m.start())
+    return index
+
+def merge_matches(lists: List[List[Match]]) -> List[Match]:
+    """Merge per-term match lists (each sorted by start) into one sorted list."""
+    return list(heapq.merge(*lists))
+
+def build_matches(postings: Iterable[Tuple[str, List[int]]], q_terms: List[str]) -> List[Match]:
+    """
+    Turn one document's postings [(term, positions)] into sorted matches.
+    A query term matches every indexed term it is a prefix of, so "renew"
+    also finds "renewal" as the old substring search did.
+    """
+    lists = []
+    for term, positions in postings:
+        qi = next((i for i, t in enumerate(q_terms) if term.startswith(t)), None)
+        if qi is not None:
+            lists.append([(p, p + len(term), qi) for p in positions])
+    return merge_matches(lists)
+
+def best_windows(matches: List[Match], n_terms: int, text_len: int, window: int = WINDOW_CHARS, k: int = 2) -> List[Dict]:
+    """
+    Return up to k windows [{"first", "last", "start", "end", "passage_start",
+    "passage_end", "score", "terms"}] over `matches`, best first. Each window
+    spans matches[first..last] within `window` chars and is scored by the
+    number of distinct query terms it covers, then by its number of matches.
+    The passages (window padded by passage_bounds) never overlap.
+
+    The sweep is linear in the number of matches; selection takes the best
+    candidates with heapq.nlargest, widening only if overlaps leave fewer than k.
+    """
+    if not matches or k <= 0:
+        return []
+    counts = [0] * n_terms
+    distinct = 0
+    left = 0
+    candidates = []
+    for right, (_, end, t) in enumerate(matches):
+        if counts[t] == 0:
+            distinct += 1
+        counts[t] += 1
+        while left < right and end - matches[left][0] > window:
+            lt = matches[left][2]
+            counts[lt] -= 1
+            if counts[lt] == 0:
+                distinct -= 1
+            left += 1
+        # -left: earlier windows win ties
+        candidates.append((distinct, right - left + 1, -left, right))
+
+    n = min(len(candidates), k * 4)
+    while True:
+        chosen = []
+        for distinct, count, neg_left, right in heapq.nlargest(n, candidates):
+            first = -neg_left
+            start, end = matches[first][0], matches[right][1]
+            lo, hi = passage_bounds(start, end, text_len, window)
+            if any(lo < c["passage_end"] and c["passage_start"] < hi for c in chosen):
+                continue
+            chosen.append({
+                "first": first, "last": right, "start": start, "end": end,
+                "passage_start": lo, "passage_end": hi, "score": count, "terms": distinct,
+            })
+            if len(chosen) == k:
+                return chosen
+        if n == len(candidates):
+            return chosen
+        n = min(len(candidates), n * 4)
+
+def passage_bounds(start: int, end: int, text_len: int, window: int = WINDOW_CHARS) -> Tuple[int, int]:
+    """Pad a match span [start, end) evenly out to `window` chars, clamped to the text."""
+    pad = max(0, window - (end - start)) // 2
+    lo = max(0, start - pad)
+    hi = min(text_len, end + pad)
+    return lo, hi
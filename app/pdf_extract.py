@@ -1,24 +1,150 @@
-import fitz  # PyMuPDF
-from typing import List, Dict
+"""
+PDF text extraction with page-level character spans.
 
-def extract_pdf_pages_with_spans(file_path: str) -> List[Dict]:
+Large documents are split into page ranges and extracted in parallel worker
+processes; each worker opens the PDF on its own and results are merged back
+in page order before offsets are assigned. An optional layout mode also
+captures block- or word-level bounding boxes with their character spans, so
+citations can be highlighted later without re-parsing the PDF.
+"""
+
+import math
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Optional
+from .startup import lazy_import
+
+LAYOUT_MODES = ("blocks", "words")
+
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(os.cpu_count() or 1, 8))))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+
+class PdfExtractionError(RuntimeError):
+    """Raised when the worker processes keep dying on a document (e.g. MuPDF crash, OOM kill)."""
+
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pool_lock = threading.Lock()
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    # long-lived pools keyed by size; spawn (not fork) because the server is threaded
+    with _pool_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return pool
+
+def _discard_pool(workers: int, pool: ProcessPoolExecutor):
+    """Drop a broken pool so the next call starts a fresh one."""
+    with _pool_lock:
+        if _pools.get(workers) is pool:
+            del _pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _page_layout(page, text: str, layout: str) -> List[Dict]:
     """
-    Returns list of pages with:
-    { "page": int, "text": str, "start_char": int, "end_char": int }
-    Start/end are cumulative offsets across the whole document.
+    Locate each block/word of the page in its plain text (in reading order)
+    and return [{"start", "end", "bbox"}] with page-relative offsets.
+    Items that cannot be matched against the text are skipped.
     """
+    if layout == "words":
+        items = [(w[4], w[:4]) for w in page.get_text("words")]
+    else:
+        # block_type 1 is an image block
+        items = [(b[4].strip(), b[:4]) for b in page.get_text("blocks") if b[6] == 0]
+    spans = []
+    cursor = 0
+    for value, bbox in items:
+        if not value:
+            continue
+        pos = text.find(value, cursor)
+        if pos == -1:
+            continue
+        spans.append({"start": pos, "end": pos + len(value), "bbox": [round(c, 2) for c in bbox]})
+        cursor = pos + len(value)
+    return spans
+
+def _extract_range(file_path: str, first: int, last: int, layout: Optional[str] = None) -> List[Dict]:
+    """Extract pages [first, last) with page-relative layout spans. Runs in a worker process."""
+    fitz = lazy_import("fitz")  # PyMuPDF, loaded on first ingest
     doc = fitz.open(file_path)
     pages = []
+    try:
+        for i in range(first, last):
+            page = doc[i]
+            text = page.get_text("text")
+            item = {"page": i, "text": text}
+            if layout:
+                item["spans"] = _page_layout(page, text, layout)
+            pages.append(item)
+    finally:
+        doc.close()
+    return pages
+
+def _page_count(file_path: str) -> int:
+    fitz = lazy_import("fitz")
+    doc = fitz.open(file_path)
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+def _assign_offsets(pages: List[Dict]) -> List[Dict]:
+    """
+    Set cumulative start_char/end_char so they index into
+    join_pages_to_full_text(pages), i.e. accounting for the "\\n" separator.
+    Layout spans are shifted from page-relative to document offsets.
+    """
     offset = 0
-    for i in range(len(doc)):
-        page = doc[i]
-        text = page.get_text("text")
+    for p in pages:
         start = offset
-        end = offset + len(text)
-        pages.append({"page": i, "text": text, "start_char": start, "end_char": end})
-        offset = end
-    doc.close()
+        end = start + len(p["text"])
+        p["start_char"] = start
+        p["end_char"] = end
+        for span in p.get("spans", ()):
+            span["start"] += start
+            span["end"] += start
+        offset = end + 1
     return pages
 
+def extract_pdf_pages_with_spans(file_path: str, layout: Optional[str] = None, workers: Optional[int] = None) -> List[Dict]:
+    """
+    Returns list of pages with:
+    { "page": int, "text": str, "start_char": int, "end_char": int }
+    Start/end are cumulative offsets across the whole document.
+    With layout="blocks" or "words" each page also has
+    "spans": [{"start", "end", "bbox": [x0, y0, x1, y1]}] in document offsets.
+    Documents with at least PDF_PARALLEL_MIN_PAGES pages are extracted across
+    a pool of `workers` processes (default PDF_EXTRACT_WORKERS). If a worker
+    dies the pool is replaced and the document retried once before
+    PdfExtractionError is raised.
+    """
+    if layout is not None and layout not in LAYOUT_MODES:
+        raise ValueError(f"layout must be one of {LAYOUT_MODES}, got {layout!r}")
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+    n = _page_count(file_path)
+    if workers <= 1 or n < PDF_PARALLEL_MIN_PAGES:
+        return _assign_offsets(_extract_range(file_path, 0, n, layout))
+
+    # a couple of ranges per worker evens out pages of very different cost
+    chunk = max(1, math.ceil(n / (workers * 2)))
+    ranges = [(first, min(first + chunk, n)) for first in range(0, n, chunk)]
+    for _ in range(2):
+        pool = _get_pool(workers)
+        try:
+            futures = [pool.submit(_extract_range, file_path, first, last, layout) for first, last in ranges]
+            pages = []
+            for fut in futures:
+                pages.extend(fut.result())
+            return _assign_offsets(pages)
+        except BrokenProcessPool:
+            _discard_pool(workers, pool)
+    raise PdfExtractionError(f"worker processes died extracting {file_path}")
+
 def join_pages_to_full_text(pages):
     return "\n".join(p["text"] for p in pages)
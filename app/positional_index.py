@@ -0,0 +1,104 @@
+"""
+Positional inverted index stored in the term_postings table.
+
+Documents are indexed at ingest, in the same transaction that stores them
+(one regex pass over full_text); the retriever then reads only the postings
+of the query terms instead of scanning every document's text.
+
+Documents ingested before the index existed are backfilled by a one-off
+command, run once per deployment rather than in every worker's startup:
+
+    python -m app.positional_index
+"""
+
+import time
+from typing import Dict, List
+from sqlalchemy import or_, select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from .db import init_db, SessionLocal
+from .models import Document, TermPosting
+from .passages import term_positions, build_matches, Match
+
+def index_document(db, document_id: int, full_text: str, replace: bool = False) -> int:
+    """
+    Add the postings of one document; with replace=True drop its existing
+    postings first (re-indexing). The caller commits, together with the
+    document. Returns the number of postings added.
+    """
+    if replace:
+        db.query(TermPosting).filter(TermPosting.document_id == document_id).delete(synchronize_session=False)
+    postings = [
+        TermPosting(document_id=document_id, term=term, positions=positions)
+        for term, positions in term_positions(full_text or "").items()
+    ]
+    db.add_all(postings)
+    return len(postings)
+
+def backfill_index(session_factory=SessionLocal, batch_size: int = 50, retries: int = 5) -> int:
+    """
+    Index documents that have text but no postings yet, one document per
+    transaction so a long backfill never holds the write lock for long.
+    Safe to run next to a live server or another backfill: documents indexed
+    concurrently are skipped and lock timeouts are retried with backoff.
+    Returns how many documents this run indexed (documents whose text has no
+    indexable terms get no postings and are not counted).
+    """
+    indexed = 0
+    last_id = 0
+    while True:
+        db = session_factory()
+        try:
+            ids = [row[0] for row in db.query(Document.id).filter(
+                Document.id > last_id,
+                ~Document.id.in_(select(TermPosting.document_id)),
+                Document.full_text != "",
+            ).order_by(Document.id).limit(batch_size)]
+        finally:
+            db.close()
+        if not ids:
+            return indexed
+        for doc_id in ids:
+            if _backfill_one(session_factory, doc_id, retries):
+                indexed += 1
+        last_id = ids[-1]
+
+def _backfill_one(session_factory, doc_id: int, retries: int) -> bool:
+    for attempt in range(retries):
+        db = session_factory()
+        try:
+            if db.query(TermPosting.id).filter(TermPosting.document_id == doc_id).first() is not None:
+                return False  # indexed by a concurrent writer since the batch was listed
+            full_text = db.query(Document.full_text).filter(Document.id == doc_id).scalar()
+            added = index_document(db, doc_id, full_text)
+            db.commit()
+            return added > 0  # text without indexable terms gets no postings
+        except IntegrityError:
+            db.rollback()
+            return False  # a concurrent backfill committed the same postings first
+        except OperationalError:
+            # e.g. SQLite "database is locked" while another process writes
+            db.rollback()
+            time.sleep(0.2 * (attempt + 1))
+        finally:
+            db.close()
+    print(f"BACKFILL: gave up on document {doc_id} after {retries} attempts")
+    return False
+
+def lookup_matches(db, q_terms: List[str]) -> Dict[int, List[Match]]:
+    """
+    Return {document_id: [(start, end, query_term_index), ...]} sorted by start,
+    for every document with a posting that starts with one of the query terms.
+    """
+    if not q_terms:
+        return {}
+    postings = db.query(TermPosting.document_id, TermPosting.term, TermPosting.positions).filter(
+        or_(*[TermPosting.term.startswith(t, autoescape=True) for t in q_terms])
+    ).all()
+    per_doc: Dict[int, list] = {}
+    for doc_id, term, positions in postings:
+        per_doc.setdefault(doc_id, []).append((term, positions))
+    return {doc_id: build_matches(items, q_terms) for doc_id, items in per_doc.items()}
+
+if __name__ == "__main__":
+    init_db()
+    print(f"BACKFILL: indexed {backfill_index()} document(s)")
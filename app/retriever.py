@@ -5,14 +5,15 @@ structured citations (document_id, page, start_char, end_char, snippet).
 """
 
 from typing import List, Dict, Any
-from .embeddings import EmbeddingProvider
+from .embeddings import get_embedding_provider
 from .db import SessionLocal
 from .models import Document
-import re
+from .passages import query_terms, best_windows
+from .positional_index import lookup_matches
 
 class Retriever:
     def __init__(self):
-        self.ep = EmbeddingProvider()
+        self.ep = get_embedding_provider()
         self._is_mock = getattr(self.ep, "_initialized", False) and getattr(self.ep, "_impl", None) is None
 
         try:
@@ -32,15 +33,19 @@ class Retriever:
             
             pass
 
-    def query(self, question: str, k: int = 3) -> Dict[str, Any]:
+    def query(self, question: str, k: int = 3, passages_per_doc: int = 2) -> Dict[str, Any]:
         """
         Return structured retrieval results:
         {
             "results": [
-                {"document_id": X, "page": p, "start": s, "end": e, "text": snippet, "score": numeric}
+                {"document_id": X, "page": p, "start": s, "end": e, "text": snippet, "score": numeric,
+                 "passages": [{"page", "start", "end", "text", "score"}, ...]}
             ]
         }
-        If vector search is available, attempt to use it; otherwise fallback to naive substring search over stored documents.
+        If vector search is available, attempt to use it; otherwise fallback to keyword search
+        over the positional index. Documents are ranked by number of query-term matches; each
+        result carries its best passages (densest windows of query terms), the first of which
+        is also the result's snippet.
         """
       
         try:
@@ -50,48 +55,51 @@ class Retriever:
         except Exception:
             D, I = None, None
 
-        # Fallback naive keyword search across stored documents
+        # Fallback keyword search over the positional index
+        q_terms = query_terms(question)
         db = SessionLocal()
-        docs = db.query(Document).all()
-        q_terms = [t.lower() for t in re.findall(r"\w+", question) if len(t) > 2]
+        try:
+            matches_by_doc = lookup_matches(db, q_terms)
+            ranked = sorted(matches_by_doc.items(), key=lambda kv: len(kv[1]), reverse=True)[:k]
+            docs = {}
+            if ranked:
+                ids = [doc_id for doc_id, _ in ranked]
+                docs = {d.id: d for d in db.query(Document).filter(Document.id.in_(ids)).all()}
+        finally:
+            db.close()
+
         scored: List[Dict] = []
-        for doc in docs:
-            full = doc.full_text or ""
-           
-            score = 0
-            for term in q_terms:
-                score += full.lower().count(term)
-            if score == 0:
+        for doc_id, matches in ranked:
+            doc = docs.get(doc_id)
+            if doc is None:
                 continue
-          
-            first_pos = None
-            for term in q_terms:
-                pos = full.lower().find(term)
-                if pos != -1:
-                    first_pos = pos
-                    break
-            if first_pos is None:
+            full = doc.full_text or ""
+            passages = []
+            for w in best_windows(matches, len(q_terms), len(full), k=passages_per_doc):
+                start, end = w["passage_start"], w["passage_end"]
+                passages.append({
+                    "page": _page_of(doc.pages, w["start"]),
+                    "start": start,
+                    "end": end,
+                    "text": full[start:end],
+                    "score": w["score"],
+                })
+            if not passages:
                 continue
-          
-            page_info = None
-            if doc.pages:
-                for p in doc.pages:
-                    if p.get("start_char", 0) <= first_pos < p.get("end_char", 0):
-                        page_info = p
-                        break
-            
-            start = max(0, first_pos - 80)
-            end = min(len(full), first_pos + 200)
-            snippet = full[start:end]
+            best = passages[0]
             scored.append({
                 "document_id": doc.id,
-                "page": page_info.get("page") if page_info else None,
-                "start": start,
-                "end": end,
-                "text": snippet,
-                "score": score
+                "page": best["page"],
+                "start": best["start"],
+                "end": best["end"],
+                "text": best["text"],
+                "score": len(matches),
+                "passages": passages,
             })
-        
-        scored_sorted = sorted(scored, key=lambda x: x["score"], reverse=True)[:k]
-        db.close()
-        return {"results": scored_sorted}
+        return {"results": scored}
+
+def _page_of(pages, pos: int):
+    for p in pages or []:
+        if p.get("start_char", 0) <= pos < p.get("end_char", 0):
+            return p.get("page")
+    return None
@@ -0,0 +1,303 @@
+"""
+Admission control and priority scheduling for the heavy endpoints.
+
+Every scheduled endpoint runs in a named lane. A lane has:
+ - priority (INTERACTIVE requests are served before BULK ones)
+ - max_concurrency: how many requests of that lane may run at once
+ - max_queue: how many requests may wait for a slot before new ones are shed
+ - max_wait_s: queue wait budget; a request that waits longer is shed
+On top of the per-lane limits there is a global concurrency cap shared by all
+lanes, with a few slots reserved for interactive traffic so bulk work
+(ingest, batch audits) can never take the whole pool.
+
+Shed requests raise Overloaded, which the API turns into a 429 with a
+Retry-After header. Admission is awaited on the event loop, so queued
+requests hold no threadpool thread; only admitted work is handed to the
+threadpool, and at most total_concurrency of it at a time. Slots may be
+released from any thread (e.g. a streaming response finishing in the pool).
+"""
+
+import asyncio
+import bisect
+import itertools
+import math
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+INTERACTIVE = 0
+BULK = 1
+
+LANES = {
+    "ask": {"priority": INTERACTIVE, "max_concurrency": 4, "max_queue": 32, "max_wait_s": 2.0},
+    "ask_stream": {"priority": INTERACTIVE, "max_concurrency": 4, "max_queue": 32, "max_wait_s": 2.0},
+    "extract": {"priority": INTERACTIVE, "max_concurrency": 4, "max_queue": 32, "max_wait_s": 2.0},
+    "audit": {"priority": BULK, "max_concurrency": 2, "max_queue": 16, "max_wait_s": 10.0},
+    "ingest": {"priority": BULK, "max_concurrency": 2, "max_queue": 8, "max_wait_s": 10.0},
+}
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed because its lane is saturated."""
+    def __init__(self, lane: str, retry_after: int, reason: str):
+        super().__init__(f"{lane}: {reason}")
+        self.lane = lane
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Lane:
+    def __init__(self, name: str, priority: int, max_concurrency: int, max_queue: int, max_wait_s: float):
+        self.name = name
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self.in_flight = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self.avg_wait_s = 0.0
+        self.avg_service_s = 0.0
+
+
+class _Waiter:
+    __slots__ = ("lane", "granted", "future", "loop")
+
+    def __init__(self, lane: _Lane, loop: asyncio.AbstractEventLoop):
+        self.lane = lane
+        self.granted = False
+        self.loop = loop
+        self.future = loop.create_future()
+
+    def wake(self):
+        def _set():
+            if not self.future.done():
+                self.future.set_result(None)
+        self.loop.call_soon_threadsafe(_set)
+
+
+class Slot:
+    """A granted execution slot. Release it exactly once (extra calls are no-ops, from any thread)."""
+    def __init__(self, scheduler: "Scheduler", lane: _Lane):
+        self._scheduler = scheduler
+        self._lane = lane
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        self._scheduler._release(self)
+
+
+class _SlotContext:
+    def __init__(self, scheduler: "Scheduler", lane_name: str):
+        self._scheduler = scheduler
+        self._lane_name = lane_name
+        self._slot = None
+
+    async def __aenter__(self) -> Slot:
+        self._slot = await self._scheduler.acquire(self._lane_name)
+        return self._slot
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._slot.release()
+        return False
+
+
+class SlotReleasingIterator:
+    """
+    Wraps a response body iterator so its slot is released when the body is
+    exhausted, closed, or garbage collected - even if it was never iterated
+    (e.g. the response was never sent). Create it on the event loop.
+    """
+    def __init__(self, iterable: Iterable, slot: Slot):
+        self._it = iter(iterable)
+        self._slot = slot
+        self._loop = asyncio.get_running_loop()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._it)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        try:
+            close = getattr(self._it, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._slot.release()
+
+    def __del__(self):
+        # finalizers can run on any thread at any allocation, including while
+        # that thread holds the scheduler lock, so never take it here: hand
+        # the release back to the event loop instead
+        try:
+            self._loop.call_soon_threadsafe(self._slot.release)
+        except RuntimeError:
+            pass  # loop already closed
+
+
+class Scheduler:
+    """
+    Grants slots to lanes under per-lane and global concurrency limits.
+    Waiters are served in (priority, arrival) order; a waiter that cannot run
+    yet (e.g. its lane is at its limit) does not block other lanes.
+    """
+    _EWMA_ALPHA = 0.2
+
+    def __init__(self, lanes: Optional[Dict[str, Dict]] = None, total_concurrency: int = 8, interactive_reserved: int = 2):
+        self.total_concurrency = total_concurrency
+        self.interactive_reserved = min(interactive_reserved, max(total_concurrency - 1, 0))
+        self._lanes = {name: _Lane(name, **cfg) for name, cfg in (lanes or LANES).items()}
+        self._lock = threading.Lock()
+        self._queue = []  # sorted list of (priority, seq, waiter)
+        self._seq = itertools.count()
+        self._in_flight = 0
+
+    async def acquire(self, lane_name: str) -> Slot:
+        """Wait (without holding a thread) until a slot is granted for lane_name, or raise Overloaded."""
+        lane = self._lanes[lane_name]
+        arrived = time.monotonic()
+        waiter = _Waiter(lane, asyncio.get_running_loop())
+        entry = (lane.priority, next(self._seq), waiter)
+        with self._lock:
+            bisect.insort(self._queue, entry)
+            lane.queued += 1
+            self._dispatch()
+            if not waiter.granted:
+                if lane.queued > lane.max_queue:
+                    self._drop(entry)
+                    raise Overloaded(lane.name, self._retry_after(lane), "queue full")
+                lane.peak_queued = max(lane.peak_queued, lane.queued)
+        if not waiter.granted:
+            try:
+                await asyncio.wait_for(waiter.future, lane.max_wait_s)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    if not waiter.granted:
+                        self._drop(entry)
+                        raise Overloaded(lane.name, self._retry_after(lane), "queue wait budget exceeded")
+            except asyncio.CancelledError:
+                # request went away while queued; give back a slot granted in the meantime
+                with self._lock:
+                    if waiter.granted:
+                        self._release_locked(lane, 0.0)
+                    else:
+                        self._queue.remove(entry)
+                        lane.queued -= 1
+                raise
+        with self._lock:
+            lane.avg_wait_s = self._ewma(lane.avg_wait_s, time.monotonic() - arrived)
+        return Slot(self, lane)
+
+    def slot(self, lane_name: str) -> _SlotContext:
+        """Context-manager form: `async with scheduler.slot("ask"): ...`."""
+        return _SlotContext(self, lane_name)
+
+    def snapshot(self) -> Dict:
+        """Queue-depth and admission metrics for /metrics."""
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "queued": len(self._queue),
+                "total_concurrency": self.total_concurrency,
+                "lanes": {
+                    lane.name: {
+                        "priority": "interactive" if lane.priority == INTERACTIVE else "bulk",
+                        "in_flight": lane.in_flight,
+                        "queued": lane.queued,
+                        "peak_queued": lane.peak_queued,
+                        "max_concurrency": lane.max_concurrency,
+                        "max_queue": lane.max_queue,
+                        "admitted": lane.admitted,
+                        "shed": lane.shed,
+                        "avg_wait_ms": round(lane.avg_wait_s * 1000, 2),
+                        "avg_service_ms": round(lane.avg_service_s * 1000, 2),
+                    }
+                    for lane in self._lanes.values()
+                },
+            }
+
+    # internals (call with self._lock held, except _release)
+
+    def _can_admit(self, lane: _Lane) -> bool:
+        if lane.in_flight >= lane.max_concurrency:
+            return False
+        limit = self.total_concurrency
+        if lane.priority != INTERACTIVE:
+            limit -= self.interactive_reserved
+        return self._in_flight < limit
+
+    def _dispatch(self):
+        for entry in list(self._queue):
+            if self._in_flight >= self.total_concurrency:
+                break
+            waiter = entry[2]
+            lane = waiter.lane
+            if not self._can_admit(lane):
+                continue
+            self._queue.remove(entry)
+            waiter.granted = True
+            lane.queued -= 1
+            lane.in_flight += 1
+            lane.admitted += 1
+            self._in_flight += 1
+            waiter.wake()
+
+    def _drop(self, entry):
+        self._queue.remove(entry)
+        lane = entry[2].lane
+        lane.queued -= 1
+        lane.shed += 1
+
+    def _release(self, slot: Slot):
+        with self._lock:
+            if slot._released:
+                return
+            slot._released = True
+            self._release_locked(slot._lane, time.monotonic() - slot._started)
+
+    def _release_locked(self, lane: _Lane, held_s: float):
+        lane.in_flight -= 1
+        self._in_flight -= 1
+        lane.avg_service_s = self._ewma(lane.avg_service_s, held_s)
+        self._dispatch()
+
+    def _retry_after(self, lane: _Lane) -> int:
+        # rough time for the lane's backlog to drain at its concurrency limit
+        estimate = lane.avg_service_s * (lane.queued + 1) / max(lane.max_concurrency, 1)
+        return max(1, math.ceil(estimate))
+
+    def _ewma(self, current: float, sample: float) -> float:
+        if current == 0.0:
+            return sample
+        return current + self._EWMA_ALPHA * (sample - current)
+
+
+def _lanes_from_env() -> Dict[str, Dict]:
+    """Per-lane overrides, e.g. SCHED_INGEST_CONCURRENCY=1 or SCHED_ASK_MAX_WAIT_S=1.5."""
+    lanes = {}
+    for name, cfg in LANES.items():
+        prefix = f"SCHED_{name.upper()}_"
+        lanes[name] = {
+            "priority": cfg["priority"],
+            "max_concurrency": int(os.getenv(prefix + "CONCURRENCY", cfg["max_concurrency"])),
+            "max_queue": int(os.getenv(prefix + "MAX_QUEUE", cfg["max_queue"])),
+            "max_wait_s": float(os.getenv(prefix + "MAX_WAIT_S", cfg["max_wait_s"])),
+        }
+    return lanes
+
+
+scheduler = Scheduler(
+    _lanes_from_env(),
+    total_concurrency=int(os.getenv("SCHED_TOTAL_CONCURRENCY", "8")),
+    interactive_reserved=int(os.getenv("SCHED_INTERACTIVE_RESERVED", "2")),
+)
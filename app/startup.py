@@ -0,0 +1,169 @@
+"""
+Startup helpers: deferred imports, an import/initialization time profiler and
+a preload mode for forking servers.
+
+- lazy_import(name): import a heavy dependency (fitz, openai, ...) on the
+  first code path that needs it, recording how long the import took.
+- timed(phase): record the duration of an initialization step (init_db, model load).
+- STARTUP_PROFILE=1 installs an import hook (see app/__init__.py) that records
+  self and cumulative import time for every module loaded afterwards, like
+  `python -X importtime` but queryable at runtime via startup_report().
+- PRELOAD_MODELS=1 loads the heavy dependencies and the embedding model when
+  app.main is imported, so `gunicorn --preload` loads them once in the master
+  and forked workers share the pages copy-on-write.
+
+This module must only import the standard library: it is imported before
+anything else in the app package when profiling.
+"""
+
+import gc
+import importlib
+import importlib.abc
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+_PHASES: Dict[str, float] = {}
+_IMPORTS: Dict[str, Dict[str, float]] = {}
+_lock = threading.Lock()
+_profiler = None
+
+
+@contextmanager
+def timed(phase: str):
+    """Record wall time of an initialization step under `phase` (in ms)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - t0) * 1000
+        with _lock:
+            _PHASES[phase] = _PHASES.get(phase, 0.0) + elapsed
+
+
+def lazy_import(name: str):
+    """Return module `name`, importing (and timing) it on first use."""
+    mod = sys.modules.get(name)
+    if mod is not None:
+        return mod
+    with timed(f"import:{name}"):
+        return importlib.import_module(name)
+
+
+class _TimedLoader:
+    """Proxy loader that times exec_module and delegates everything else."""
+    def __init__(self, loader, name: str, profiler: "_ImportProfiler"):
+        self._loader = loader
+        self._name = name
+        self._profiler = profiler
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._enter()
+        t0 = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit(self._name, time.perf_counter() - t0)
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+
+class _ImportProfiler(importlib.abc.MetaPathFinder):
+    """
+    Meta path finder that asks the remaining finders for a spec and wraps its
+    loader in _TimedLoader. A per-thread stack of child times turns the
+    inclusive (cumulative) time of nested imports into self time.
+    """
+    def __init__(self):
+        self._local = threading.local()
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self._local, "finding", False):
+            return None
+        self._local.finding = True
+        try:
+            spec = None
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+        finally:
+            self._local.finding = False
+        if spec is None or spec.loader is None or not hasattr(spec.loader, "exec_module"):
+            return spec
+        spec.loader = _TimedLoader(spec.loader, fullname, self)
+        return spec
+
+    def _enter(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0)
+
+    def _exit(self, name: str, elapsed: float):
+        stack = self._local.stack
+        children = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        with _lock:
+            _IMPORTS[name] = {
+                "self_ms": round((elapsed - children) * 1000, 3),
+                "cumulative_ms": round(elapsed * 1000, 3),
+            }
+
+
+def install_import_profiler():
+    """Start recording per-module import times (idempotent)."""
+    global _profiler
+    if _profiler is None:
+        _profiler = _ImportProfiler()
+        sys.meta_path.insert(0, _profiler)
+
+
+def uninstall_import_profiler():
+    global _profiler
+    if _profiler is not None:
+        try:
+            sys.meta_path.remove(_profiler)
+        except ValueError:
+            pass
+        _profiler = None
+
+
+def startup_report(top: int = 25) -> Dict:
+    """
+    Return {"phases": {phase: ms}, "imports": [{module, self_ms, cumulative_ms}]}
+    with imports sorted by cumulative time (only populated when profiling).
+    """
+    with _lock:
+        phases = {k: round(v, 3) for k, v in _PHASES.items()}
+        imports = [{"module": name, **t} for name, t in _IMPORTS.items()]
+    imports.sort(key=lambda x: x["cumulative_ms"], reverse=True)
+    return {"phases": phases, "imports": imports[:top]}
+
+
+def preload():
+    """
+    Load heavy dependencies and the shared embedding model up front, then
+    freeze the GC so collections in forked workers don't touch (and copy)
+    the preloaded objects' pages.
+    """
+    from .embeddings import get_embedding_provider
+
+    for name in ("fitz", "openai"):
+        try:
+            lazy_import(name)
+        except ImportError:
+            pass
+    get_embedding_provider().dim  # timed as init:embeddings
+    gc.collect()
+    if hasattr(gc, "freeze"):
+        gc.freeze()
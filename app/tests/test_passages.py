@@ -0,0 +1,37 @@
+# app/tests/test_passages.py
+from app.passages import query_terms, term_positions, build_matches, best_windows, passage_bounds
+
+def _matches(text, q_terms):
+    return build_matches(term_positions(text).items(), q_terms)
+
+def test_query_terms_dedup_and_min_length():
+    assert query_terms("Is the Renewal auto renewal? is it") == ["the", "renewal", "auto"]
+
+def test_build_matches_uses_prefixes():
+    matches = _matches("auto renewal renew", query_terms("renew"))
+    assert [(s, e) for s, e, _ in matches] == [(5, 12), (13, 18)]
+
+def test_best_window_prefers_all_terms_over_first_occurrence():
+    text = "liability " + "x " * 300 + "the liability cap is limited to fees paid"
+    q = query_terms("liability cap")
+    windows = best_windows(_matches(text, q), len(q), len(text), window=60, k=2)
+    assert windows[0]["terms"] == 2
+    assert text[windows[0]["start"]:windows[0]["end"]] == "liability cap"
+    assert len(windows) == 2
+    assert windows[1]["start"] == 0
+
+def test_padded_passages_do_not_overlap():
+    text = "renew " * 200
+    q = query_terms("renew")
+    windows = best_windows(_matches(text, q), len(q), len(text), window=30, k=5)
+    assert len(windows) == 5
+    spans = sorted((w["passage_start"], w["passage_end"]) for w in windows)
+    assert all(a[1] <= b[0] for a, b in zip(spans, spans[1:]))
+    for w in windows:
+        assert (w["passage_start"], w["passage_end"]) == passage_bounds(w["start"], w["end"], len(text), 30)
+
+def test_passage_bounds_clamp():
+    assert passage_bounds(0, 5, 40, window=280) == (0, 40)
+
+def test_no_matches():
+    assert best_windows([], 1, 0) == []
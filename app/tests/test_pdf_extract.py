@@ -0,0 +1,71 @@
+# app/tests/test_pdf_extract.py
+import pytest
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from app import pdf_extract
+from app.pdf_extract import _assign_offsets, join_pages_to_full_text, extract_pdf_pages_with_spans
+
+def test_offsets_index_into_full_text():
+    pages = [{"page": 0, "text": "alpha", "spans": [{"start": 0, "end": 5, "bbox": [0, 0, 1, 1]}]},
+             {"page": 1, "text": "beta gamma", "spans": [{"start": 5, "end": 10, "bbox": [0, 0, 1, 1]}]}]
+    _assign_offsets(pages)
+    full = join_pages_to_full_text(pages)
+    for p in pages:
+        assert full[p["start_char"]:p["end_char"]] == p["text"]
+    assert full[pages[1]["spans"][0]["start"]:pages[1]["spans"][0]["end"]] == "gamma"
+
+def test_parallel_matches_serial(tmp_path, monkeypatch):
+    fitz = pytest.importorskip("fitz")
+    monkeypatch.setattr("app.pdf_extract.PDF_PARALLEL_MIN_PAGES", 1)
+    path = tmp_path / "many.pdf"
+    doc = fitz.open()
+    for i in range(12):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Page {i} renewal clause number {i}")
+    doc.save(str(path))
+    doc.close()
+    serial = extract_pdf_pages_with_spans(str(path), layout="words", workers=1)
+    parallel = extract_pdf_pages_with_spans(str(path), layout="words", workers=3)
+    assert parallel == serial
+    full = join_pages_to_full_text(serial)
+    span = serial[5]["spans"][1]
+    assert full[span["start"]:span["end"]] == "5"
+
+class _FakePool:
+    def __init__(self, broken):
+        self.broken = broken
+        self.shut_down = False
+
+    def submit(self, fn, *args):
+        fut = Future()
+        if self.broken:
+            fut.set_exception(BrokenProcessPool("worker died"))
+        else:
+            fut.set_result(fn(*args))
+        return fut
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+def _fake_extract(file_path, first, last, layout=None):
+    return [{"page": i, "text": f"page {i}"} for i in range(first, last)]
+
+def test_broken_pool_is_replaced_and_retried(monkeypatch):
+    pools = [_FakePool(broken=True), _FakePool(broken=False)]
+    monkeypatch.setattr(pdf_extract, "PDF_PARALLEL_MIN_PAGES", 1)
+    monkeypatch.setattr(pdf_extract, "_page_count", lambda path: 4)
+    monkeypatch.setattr(pdf_extract, "_extract_range", _fake_extract)
+    monkeypatch.setattr(pdf_extract, "_pools", {3: pools[0]})
+    monkeypatch.setattr(pdf_extract, "_get_pool", lambda workers: pdf_extract._pools.setdefault(workers, pools[1]))
+    pages = extract_pdf_pages_with_spans("unused.pdf", workers=3)
+    assert [p["page"] for p in pages] == [0, 1, 2, 3]
+    assert pools[0].shut_down
+    assert pdf_extract._pools[3] is pools[1]
+
+def test_worker_deaths_raise_extraction_error(monkeypatch):
+    monkeypatch.setattr(pdf_extract, "PDF_PARALLEL_MIN_PAGES", 1)
+    monkeypatch.setattr(pdf_extract, "_page_count", lambda path: 4)
+    monkeypatch.setattr(pdf_extract, "_pools", {})
+    monkeypatch.setattr(pdf_extract, "_get_pool", lambda workers: pdf_extract._pools.setdefault(workers, _FakePool(broken=True)))
+    with pytest.raises(pdf_extract.PdfExtractionError):
+        extract_pdf_pages_with_spans("unused.pdf", workers=2)
@@ -0,0 +1,91 @@
+# app/tests/test_retriever.py
+import uuid
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.db import init_db, SessionLocal
+from app.models import Document, TermPosting
+from app.passages import term_positions
+from app.pdf_extract import _assign_offsets, join_pages_to_full_text
+from app.positional_index import index_document, lookup_matches, backfill_index
+from app.retriever import Retriever
+
+def setup_indexed_doc():
+    # unique terms so documents left by earlier runs don't compete
+    a, b = "zq" + uuid.uuid4().hex[:10], "zq" + uuid.uuid4().hex[:10]
+    init_db()
+    pages = _assign_offsets([
+        {"page": 0, "text": f"The {a} {b} clause applies. " + "lorem " * 100},
+        {"page": 1, "text": "ipsum " * 10 + f"Any {a} {b} renewal needs notice."},
+    ])
+    full_text = join_pages_to_full_text(pages)
+    db = SessionLocal()
+    doc = Document(filename="zorblat.pdf", full_text=full_text, pages=pages, metadata_json={})
+    db.add(doc)
+    db.flush()
+    index_document(db, doc.id, full_text)
+    db.commit()
+    doc_id = doc.id
+    db.close()
+    return doc_id, full_text, f"{a} {b}"
+
+def test_reindexing_replaces_postings():
+    doc_id, full_text, question = setup_indexed_doc()
+    db = SessionLocal()
+    index_document(db, doc_id, full_text, replace=True)
+    db.commit()
+    count = db.query(TermPosting).filter(TermPosting.document_id == doc_id).count()
+    matches = lookup_matches(db, question.split())[doc_id]
+    db.close()
+    assert count == len(term_positions(full_text))
+    assert len(matches) == 4
+    assert all(full_text[s:e] in question.split() for s, e, _ in matches)
+
+def test_backfill_indexes_documents_without_postings_once():
+    init_db()
+    tag = "zq" + uuid.uuid4().hex[:10]
+    db = SessionLocal()
+    doc = Document(filename="old.pdf", full_text=f"legacy {tag} text", pages=[], metadata_json={})
+    db.add(doc)
+    db.commit()
+    doc_id = doc.id
+    db.close()
+
+    assert backfill_index() >= 1
+    assert backfill_index() == 0
+    db = SessionLocal()
+    terms = [t for (t,) in db.query(TermPosting.term).filter(TermPosting.document_id == doc_id)]
+    db.close()
+    assert sorted(terms) == sorted(["legacy", tag, "text"])
+
+def test_query_returns_best_passages_with_pages():
+    doc_id, full_text, question = setup_indexed_doc()
+    res = Retriever().query(question, k=1, passages_per_doc=2)
+    result = res["results"][0]
+    assert result["document_id"] == doc_id
+    passages = result["passages"]
+    assert len(passages) == 2
+    assert {p["page"] for p in passages} == {0, 1}
+    for p in passages:
+        assert p["text"] == full_text[p["start"]:p["end"]]
+        assert question in p["text"]
+    spans = sorted((p["start"], p["end"]) for p in passages)
+    assert spans[0][1] <= spans[1][0]
+
+def test_ask_cites_every_passage():
+    pytest.importorskip("fastapi")
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    doc_id, _, question = setup_indexed_doc()
+    client = TestClient(app)
+    resp = client.post("/ask", json={"question": question, "top_k": 1, "passages_per_doc": 2})
+    assert resp.status_code == 200
+    citations = resp.json()["citations"]
+    assert len(citations) == 2
+    assert {c["page"] for c in citations} == {0, 1}
+    assert all(c["document_id"] == doc_id for c in citations)
+
+    resp = client.post("/ask", json={"question": question, "passages_per_doc": 0})
+    assert resp.status_code == 422
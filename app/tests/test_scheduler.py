@@ -0,0 +1,143 @@
+# app/tests/test_scheduler.py
+import asyncio
+import gc
+import pytest
+from app.scheduler import Scheduler, Overloaded, SlotReleasingIterator, INTERACTIVE, BULK
+
+def make_scheduler(total=2, reserved=0, max_wait_s=1.0):
+    lanes = {
+        "ask": {"priority": INTERACTIVE, "max_concurrency": 2, "max_queue": 4, "max_wait_s": max_wait_s},
+        "ingest": {"priority": BULK, "max_concurrency": 2, "max_queue": 4, "max_wait_s": max_wait_s},
+    }
+    return Scheduler(lanes, total_concurrency=total, interactive_reserved=reserved)
+
+def test_lane_concurrency_limit_and_release():
+    async def run():
+        s = make_scheduler()
+        a = await s.acquire("ask")
+        b = await s.acquire("ask")
+        assert s.snapshot()["lanes"]["ask"]["in_flight"] == 2
+        a.release()
+        a.release()  # idempotent
+        b.release()
+        return s.snapshot()
+    snap = asyncio.run(run())
+    assert snap["in_flight"] == 0
+    assert snap["lanes"]["ask"]["admitted"] == 2
+
+def test_sheds_with_retry_after_when_wait_budget_exceeded():
+    async def run():
+        s = Scheduler({"ingest": {"priority": BULK, "max_concurrency": 1, "max_queue": 4, "max_wait_s": 0.05}}, total_concurrency=4, interactive_reserved=0)
+        held = await s.acquire("ingest")
+        with pytest.raises(Overloaded) as err:
+            await s.acquire("ingest")
+        assert err.value.retry_after >= 1
+        assert s.snapshot()["lanes"]["ingest"]["shed"] == 1
+        assert s.snapshot()["queued"] == 0
+        held.release()
+    asyncio.run(run())
+
+def test_sheds_immediately_when_queue_full():
+    async def run():
+        s = Scheduler({"ingest": {"priority": BULK, "max_concurrency": 1, "max_queue": 0, "max_wait_s": 5.0}}, total_concurrency=4, interactive_reserved=0)
+        held = await s.acquire("ingest")
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        with pytest.raises(Overloaded):
+            await s.acquire("ingest")
+        assert loop.time() - start < 1.0
+        held.release()
+    asyncio.run(run())
+
+def test_reserved_slots_are_not_used_by_bulk():
+    async def run():
+        s = make_scheduler(total=2, reserved=1, max_wait_s=0.05)
+        bulk = await s.acquire("ingest")
+        with pytest.raises(Overloaded):
+            await s.acquire("ingest")
+        interactive = await s.acquire("ask")
+        bulk.release()
+        interactive.release()
+    asyncio.run(run())
+
+def test_interactive_waiter_served_before_bulk():
+    async def run():
+        s = make_scheduler(total=1)
+        held = await s.acquire("ingest")
+        order = []
+
+        async def worker(lane):
+            async with s.slot(lane):
+                order.append(lane)
+
+        bulk = asyncio.create_task(worker("ingest"))
+        await asyncio.sleep(0.01)
+        interactive = asyncio.create_task(worker("ask"))
+        await asyncio.sleep(0.01)
+        assert s.snapshot()["queued"] == 2
+        held.release()
+        await asyncio.gather(bulk, interactive)
+        return order
+    assert asyncio.run(run()) == ["ask", "ingest"]
+
+def test_cancelled_waiter_leaves_queue():
+    async def run():
+        s = make_scheduler(total=1)
+        held = await s.acquire("ask")
+        task = asyncio.create_task(s.acquire("ask"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        held.release()
+        return s.snapshot()
+    snap = asyncio.run(run())
+    assert snap["queued"] == 0
+    assert snap["in_flight"] == 0
+
+def test_dropped_stream_releases_slot_without_iterating():
+    async def run():
+        s = make_scheduler()
+        slot = await s.acquire("ask")
+        started = []
+
+        def body():
+            started.append(True)
+            yield "data"
+
+        it = SlotReleasingIterator(body(), slot)
+        assert s.snapshot()["in_flight"] == 1
+        del it
+        gc.collect()
+        await asyncio.sleep(0)  # the finalizer hands the release to the loop
+        return s.snapshot(), started
+    snap, started = asyncio.run(run())
+    assert started == []
+    assert snap["in_flight"] == 0
+
+def test_finalizer_does_not_take_scheduler_lock():
+    async def run():
+        s = make_scheduler()
+        slot = await s.acquire("ask")
+        it = SlotReleasingIterator(iter(["a"]), slot)
+        it.cycle = it  # only reachable through a reference cycle
+        del it
+        with s._lock:  # would deadlock if the finalizer released synchronously
+            gc.collect()
+        await asyncio.sleep(0)
+        return s.snapshot()
+    assert asyncio.run(run())["in_flight"] == 0
+
+def test_exhausted_stream_releases_slot_once():
+    async def run():
+        s = make_scheduler()
+        slot = await s.acquire("ask")
+        it = SlotReleasingIterator(iter(["a", "b"]), slot)
+        assert list(it) == ["a", "b"]
+        in_flight = s.snapshot()["in_flight"]
+        slot.release()  # e.g. the response's background task
+        return in_flight, s.snapshot()
+    in_flight, snap = asyncio.run(run())
+    assert in_flight == 0
+    assert snap["in_flight"] == 0
+    assert snap["lanes"]["ask"]["admitted"] == 1
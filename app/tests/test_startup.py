@@ -0,0 +1,72 @@
+# app/tests/test_startup.py
+import os
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+from app import embeddings, startup
+from app.startup import lazy_import, timed, startup_report, install_import_profiler, uninstall_import_profiler
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+def test_timed_and_lazy_import_record_phases():
+    with timed("init:test_phase"):
+        pass
+    mod = lazy_import("json")
+    assert mod is sys.modules["json"]
+    phases = startup_report()["phases"]
+    assert "init:test_phase" in phases
+
+def test_import_profiler_records_self_and_cumulative(tmp_path, monkeypatch):
+    (tmp_path / "ci_profiled_child.py").write_text("X = 1\n")
+    (tmp_path / "ci_profiled_parent.py").write_text("import ci_profiled_child\nY = ci_profiled_child.X\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    install_import_profiler()
+    try:
+        import ci_profiled_parent
+        assert ci_profiled_parent.Y == 1
+    finally:
+        uninstall_import_profiler()
+        sys.modules.pop("ci_profiled_parent", None)
+        sys.modules.pop("ci_profiled_child", None)
+    imports = {i["module"]: i for i in startup_report(top=1000)["imports"]}
+    parent = imports["ci_profiled_parent"]
+    child = imports["ci_profiled_child"]
+    assert parent["cumulative_ms"] >= child["cumulative_ms"]
+    assert parent["self_ms"] <= parent["cumulative_ms"]
+
+def test_importing_main_defers_heavy_dependencies():
+    pytest.importorskip("fastapi")
+    pytest.importorskip("sqlalchemy")
+    env = {k: v for k, v in os.environ.items() if k != "PRELOAD_MODELS"}
+    code = (
+        "import sys, app.main; "
+        "heavy = [m for m in ('fitz', 'openai', 'numpy', 'faiss', 'sentence_transformers') if m in sys.modules]; "
+        "print(','.join(heavy))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
+
+def test_preload_loads_dependencies_and_model_then_freezes_gc(monkeypatch):
+    imported, froze = [], []
+
+    def fake_import(name):
+        imported.append(name)
+        if name == "openai":
+            raise ImportError(name)
+
+    class FakeProvider:
+        loaded = False
+
+        @property
+        def dim(self):
+            FakeProvider.loaded = True
+            return 32
+
+    monkeypatch.setattr(startup, "lazy_import", fake_import)
+    monkeypatch.setattr(embeddings, "get_embedding_provider", lambda: FakeProvider())
+    monkeypatch.setattr(startup.gc, "freeze", lambda: froze.append(True))
+    startup.preload()
+    assert imported == ["fitz", "openai"]
+    assert FakeProvider.loaded
+    assert froze == [True]